@@ -3,6 +3,7 @@ import { promisify } from 'util';
 import path from 'path';
 import fs from 'fs';
 import { fileURLToPath } from 'url';
+import { WorkerManager } from '../pipeline/WorkerManager';
 
 const execFileAsync = promisify(execFile);
 const __dirname = path.dirname(fileURLToPath(import.meta.url));
@@ -38,8 +39,22 @@ const PYMUPDF_SCRIPT = path.join(SCRIPTS_DIR, 'pymupdf4llm_extract.py');
 const GS_RENDER_SCRIPT = path.join(SCRIPTS_DIR, 'gs_render.py');
 const IMAGE_TO_PAGES_SCRIPT = path.join(SCRIPTS_DIR, 'image_to_pages.py');
 const TESSERACT_SCRIPT = path.join(SCRIPTS_DIR, 'tesseract_ocr.py');
-const PADDLE_SCRIPT = path.join(SCRIPTS_DIR, 'paddle_ocr.py');
-const VLM_PREPROCESS_SCRIPT = path.join(SCRIPTS_DIR, 'vlm_preprocess.py');
+
+/** Per-request limit for the model daemons, same as the one-shot script calls they replaced. */
+const DAEMON_REQUEST_TIMEOUT_MS = 300_000;
+
+/**
+ * Persistent daemons for the model-heavy scripts — PaddleOCR and the PaddleX
+ * orient/unwarp models stay loaded between invoices instead of paying a cold
+ * start on every call. Spawned on first use, shut down after the idle timeout,
+ * killed and re-spawned if a request runs past DAEMON_REQUEST_TIMEOUT_MS.
+ */
+export const paddleOcrWorker = new WorkerManager(
+  'paddle_ocr.py', 'paddle', undefined, ['--daemon'], DAEMON_REQUEST_TIMEOUT_MS,
+);
+export const vlmPreprocessWorker = new WorkerManager(
+  'vlm_preprocess.py', 'vlm-preprocess', undefined, ['--daemon'], DAEMON_REQUEST_TIMEOUT_MS,
+);
 
 // ─── VLM OCR shared config ─────────────────────────────────────────
 const VLM_MODEL = 'glm-4.6v-flash';
@@ -104,6 +119,12 @@ async function callVlmWithRetry(
   throw new Error('VLM API failed after all retries');
 }
 
+/** Options for the VLM preprocessing step (vlm_preprocess.py). */
+export interface VlmPreprocessOptions {
+  /** Skip UVDoc on pages that already look flat — set for Ghostscript-rendered PDF pages. */
+  skipUnwarpIfFlat?: boolean;
+}
+
 /** Supported image extensions (non-PDF documents that go straight to OCR). */
 export const IMAGE_EXTENSIONS = new Set([
   '.heic', '.heif', '.jpg', '.jpeg', '.png', '.tiff', '.tif', '.bmp', '.webp',
@@ -181,7 +202,7 @@ async function extractFromPdf(absolutePath: string): Promise<PdfExtraction> {
     throw new Error(`Ghostscript rendering failed: ${gsError instanceof Error ? gsError.message : gsError}`);
   }
 
-  return runOcrPipeline(imageDir, textLayerResult, textLayerBroken);
+  return runOcrPipeline(imageDir, textLayerResult, textLayerBroken, { skipUnwarpIfFlat: true });
 }
 
 /**
@@ -226,9 +247,10 @@ async function runOcrPipeline(
   imageDir: string,
   textLayerResult: PdfExtraction | null,
   textLayerBroken: boolean,
+  preprocessOptions: VlmPreprocessOptions = {},
 ): Promise<PdfExtraction> {
   try {
-    const result = await runVlmOcrWithFallback(imageDir);
+    const result = await runVlmOcrWithFallback(imageDir, preprocessOptions);
     if (textLayerBroken && textLayerResult) {
       result.textLayerRef = textLayerResult.fullText;
     }
@@ -243,7 +265,10 @@ async function runOcrPipeline(
  * Legacy fallback is available but disabled by default.
  * Set ENABLE_OCR_FALLBACK=true to enable PaddleOCR fallback on VLM failure.
  */
-export async function runVlmOcrWithFallback(imageDir: string): Promise<PdfExtraction> {
+export async function runVlmOcrWithFallback(
+  imageDir: string,
+  preprocessOptions: VlmPreprocessOptions = {},
+): Promise<PdfExtraction> {
   if (!process.env.ZAI_API_KEY) {
     console.log('Tier 2: ZAI_API_KEY not set, using PaddleOCR fallback');
     return runLegacyOcrPipeline(imageDir);
@@ -253,7 +278,7 @@ export async function runVlmOcrWithFallback(imageDir: string): Promise<PdfExtrac
 
   try {
     console.log('Tier 2: VLM OCR (preprocess + glm-4.6v-flash)...');
-    const result = await runVlmOcr(imageDir);
+    const result = await runVlmOcr(imageDir, preprocessOptions);
     result.ocrTier = 2;
     console.log('VLM OCR succeeded');
     return result;
@@ -307,15 +332,24 @@ async function runTesseract(imageDir: string): Promise<TesseractResult> {
 
 /** Legacy: Run PaddleOCR on pre-rendered images → clean formatted text. */
 async function runPaddleOcr(imageDir: string): Promise<PdfExtraction> {
-  const { stdout, stderr } = await execFileAsync('python', [PADDLE_SCRIPT, imageDir], {
-    timeout: 300_000,
-    maxBuffer: 10 * 1024 * 1024,
-  });
-  const result = parseJson<{ fullText: string; pages: string[]; totalPages: number }>(stdout, stderr);
+  // The worker streams one {page, text} line per page as it finishes (in any order),
+  // then a {summary} line — reassemble the pages by number
+  const pageTexts: string[] = [];
+  const result = await paddleOcrWorker.request({ imageDir }, (line) => {
+    const { page, text } = line as { page: number; text: string };
+    pageTexts[page - 1] = text;
+    console.log(`PaddleOCR: page ${page} done`);
+  }) as { summary: { totalPages: number } };
+
+  const { totalPages } = result.summary;
+  const pages = Array.from(
+    { length: totalPages },
+    (_, i) => pageTexts[i] ?? '[PaddleOCR extraction failed: page not processed]',
+  );
   return {
-    fullText: result.fullText,
-    pages: result.pages,
-    totalPages: result.totalPages,
+    fullText: pages.join('\n\n---\n\n'),
+    pages,
+    totalPages,
     ocrTier: 3,
   };
 }
@@ -328,11 +362,12 @@ async function runPaddleOcr(imageDir: string): Promise<PdfExtraction> {
  *
  * Preprocessing pipeline (via vlm_preprocess.py):
  * 1. Orientation detection (PP-LCNet) — auto-rotate 0/90/180/270
- * 2. Unwarping (UVDoc) — flatten curved/folded documents
+ * 2. Unwarping (UVDoc) — flatten curved/folded documents (skipped on flat
+ *    pages when preprocessOptions.skipUnwarpIfFlat is set)
  * 3. JPEG q90, capped at 5MB — maximize quality for VLM
  * Falls back to simple resize if PaddleX is unavailable.
  */
-async function runVlmOcr(imageDir: string): Promise<PdfExtraction> {
+async function runVlmOcr(imageDir: string, preprocessOptions: VlmPreprocessOptions): Promise<PdfExtraction> {
   const apiKey = process.env.ZAI_API_KEY;
   if (!apiKey) throw new Error('ZAI_API_KEY required for VLM OCR');
 
@@ -346,7 +381,7 @@ async function runVlmOcr(imageDir: string): Promise<PdfExtraction> {
   }
 
   // Preprocess: orient + unwarp + JPEG (or fall back to simple resize)
-  const pageBase64s = await preprocessImagesForVlm(imageDir, pageCount);
+  const pageBase64s = await preprocessImagesForVlm(imageDir, pageCount, preprocessOptions);
 
   const pageTexts: string[] = [];
   for (let i = 0; i < pageBase64s.length; i++) {
@@ -402,27 +437,27 @@ export async function runVlmOcrDirect(imagePath: string): Promise<PdfExtraction>
 /**
  * Preprocess page images for VLM: orientation correction, unwarping, JPEG conversion.
  *
- * Tries the full PaddleX pipeline (vlm_preprocess.py) first. If unavailable
+ * Tries the full PaddleX pipeline (vlm_preprocess.py daemon) first. If unavailable
  * (PaddleX not installed, model download fails, etc.), falls back to simple
  * Pillow resize — still produces usable JPEG, just without orient/unwarp.
  *
  * Returns an array of base64-encoded JPEG strings, one per page.
  */
-async function preprocessImagesForVlm(imageDir: string, pageCount: number): Promise<string[]> {
+async function preprocessImagesForVlm(
+  imageDir: string,
+  pageCount: number,
+  preprocessOptions: VlmPreprocessOptions,
+): Promise<string[]> {
   // Try full preprocessing pipeline (orient + unwarp + JPEG q90)
   try {
     console.log('VLM preprocess: running orientation + unwarping pipeline...');
-    const { stdout, stderr } = await execFileAsync('python', [VLM_PREPROCESS_SCRIPT, imageDir], {
-      timeout: 300_000,
-      maxBuffer: 10 * 1024 * 1024,
-    });
-    if (stderr) {
-      // Log preprocessing details (model loading, rotation info, etc.)
-      for (const line of stderr.split('\n').filter(Boolean)) {
-        console.log(`  ${line.trim()}`);
-      }
-    }
-    const result = parseJson<{ pages: { page: number; file: string; rotated: number; unwarped: boolean }[] }>(stdout, stderr);
+    // Preprocessing details (model loading, rotation info, etc.) are logged by the worker
+    const result = await vlmPreprocessWorker.request({
+      imageDir,
+      skipUnwarpIfFlat: preprocessOptions.skipUnwarpIfFlat ?? false,
+    }) as {
+      pages: { page: number; file: string; rotated: number; unwarped: boolean }[];
+    };
 
     // Read preprocessed JPEGs as base64
     const base64s: string[] = [];
@@ -495,7 +530,7 @@ export async function extractWithTier(filePath: string, targetTier: 2 | 3): Prom
   try {
     if (targetTier === 2) {
       // Tier 2: VLM OCR (with full legacy fallback)
-      const result = await runVlmOcrWithFallback(imageDir);
+      const result = await runVlmOcrWithFallback(imageDir, { skipUnwarpIfFlat: !isImage });
       if (textLayerRef) result.textLayerRef = textLayerRef;
       return result;
     }
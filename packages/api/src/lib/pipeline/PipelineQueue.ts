@@ -9,6 +9,8 @@ import {
   assessPymupdfQuality,
   runVlmOcrWithFallback,
   runVlmOcrDirect,
+  paddleOcrWorker,
+  vlmPreprocessWorker,
   type PdfExtraction,
 } from '../pdf/extract';
 import { agenticExtract } from '../llm/agent';
@@ -108,6 +110,8 @@ export class PipelineQueue {
     if (workerIdleMs !== undefined) {
       this.pymupdfWorker.idleTimeoutMs = workerIdleMs;
       this.ocrWorker.idleTimeoutMs = workerIdleMs;
+      paddleOcrWorker.idleTimeoutMs = workerIdleMs;
+      vlmPreprocessWorker.idleTimeoutMs = workerIdleMs;
     }
   }
 
@@ -312,7 +316,8 @@ export class PipelineQueue {
     // Render pages with Ghostscript
     const imageDir = await renderWithGhostscript(absolutePath);
     try {
-      const result = await runVlmOcrWithFallback(imageDir);
+      // Rasterized PDF pages are flat — let preprocessing skip UVDoc on them
+      const result = await runVlmOcrWithFallback(imageDir, { skipUnwarpIfFlat: true });
       if (textLayerBroken && textLayerResult) {
         result.textLayerRef = textLayerResult.fullText;
       }
@@ -385,6 +390,8 @@ export class PipelineQueue {
   shutdown(): void {
     this.pymupdfWorker.shutdown();
     this.ocrWorker.shutdown();
+    paddleOcrWorker.shutdown();
+    vlmPreprocessWorker.shutdown();
   }
 }
 
@@ -6,9 +6,14 @@ import { fileURLToPath } from 'url';
 const __dirname = path.dirname(fileURLToPath(import.meta.url));
 const PROJECT_ROOT = path.resolve(__dirname, '..', '..', '..', '..', '..');
 
+/** Receives intermediate NDJSON lines of a streamed response. */
+export type PartialHandler = (line: Record<string, unknown>) => void;
+
 interface PendingRequest {
   resolve: (value: Record<string, unknown>) => void;
   reject: (reason: Error) => void;
+  onPartial?: PartialHandler;
+  timer: ReturnType<typeof setTimeout> | null;
 }
 
 /**
@@ -17,30 +22,58 @@ interface PendingRequest {
  * The worker stays alive between requests — Python interpreter, imported libraries, and
  * loaded ML models remain in memory. After an idle timeout, the worker is shut down to
  * free RAM and re-spawned on the next request.
+ *
+ * By default the first stdout line answers a request. Workers that stream (paddle_ocr.py)
+ * write several lines per request: pass onPartial to receive them, and the request resolves
+ * on the line carrying `summary` (or rejects on `error`).
+ *
+ * With a request timeout set, a request that runs longer is rejected and the worker is
+ * killed, so a hung process can't stall every request queued behind it.
  */
 export class WorkerManager {
   private process: ChildProcess | null = null;
   private readline: ReadlineInterface | null = null;
   private idleTimer: ReturnType<typeof setTimeout> | null = null;
   private pending: PendingRequest | null = null;
-  private queue: Array<{ input: string; resolve: (v: Record<string, unknown>) => void; reject: (e: Error) => void }> = [];
+  private queue: Array<{
+    input: string;
+    resolve: (v: Record<string, unknown>) => void;
+    reject: (e: Error) => void;
+    onPartial?: PartialHandler;
+  }> = [];
   private busy = false;
   private scriptPath: string;
+  private scriptArgs: string[];
   private label: string;
 
   /** Idle timeout in ms — worker shuts down after this long without requests. */
   idleTimeoutMs: number;
 
-  constructor(scriptName: string, label: string, idleTimeoutMs = 5 * 60 * 1000) {
-    this.scriptPath = path.join(PROJECT_ROOT, 'scripts', scriptName);
+  /** Per-request timeout in ms (null = wait forever) — on expiry the worker is killed and re-spawned. */
+  requestTimeoutMs: number | null;
+
+  /** scriptName is resolved against the project's scripts/ directory (absolute paths are used as-is). */
+  constructor(
+    scriptName: string,
+    label: string,
+    idleTimeoutMs = 5 * 60 * 1000,
+    scriptArgs: string[] = [],
+    requestTimeoutMs: number | null = null,
+  ) {
+    this.scriptPath = path.resolve(PROJECT_ROOT, 'scripts', scriptName);
+    this.scriptArgs = scriptArgs;
     this.label = label;
     this.idleTimeoutMs = idleTimeoutMs;
+    this.requestTimeoutMs = requestTimeoutMs;
   }
 
-  /** Send a request to the worker. Spawns the process if not running. */
-  async request(input: Record<string, unknown>): Promise<Record<string, unknown>> {
+  /**
+   * Send a request to the worker. Spawns the process if not running.
+   * With onPartial, lines before the final `summary`/`error` line are passed to it.
+   */
+  async request(input: Record<string, unknown>, onPartial?: PartialHandler): Promise<Record<string, unknown>> {
     return new Promise<Record<string, unknown>>((resolve, reject) => {
-      this.queue.push({ input: JSON.stringify(input), resolve, reject });
+      this.queue.push({ input: JSON.stringify(input), resolve, reject, onPartial });
       this.processQueue();
     });
   }
@@ -50,7 +83,7 @@ export class WorkerManager {
     if (this.busy || this.queue.length === 0) return;
     this.busy = true;
 
-    const { input, resolve, reject } = this.queue.shift()!;
+    const { input, resolve, reject, onPartial } = this.queue.shift()!;
 
     if (!this.process) {
       try {
@@ -63,39 +96,79 @@ export class WorkerManager {
     }
 
     this.resetIdleTimer();
-    this.pending = { resolve, reject };
+    const pending: PendingRequest = { resolve, reject, onPartial, timer: null };
+    if (this.requestTimeoutMs !== null) {
+      const timeoutMs = this.requestTimeoutMs;
+      pending.timer = setTimeout(() => this.timeoutRequest(pending, timeoutMs), timeoutMs);
+    }
+    this.pending = pending;
 
     // Write the request to stdin (one JSON line)
     this.process!.stdin!.write(input + '\n');
   }
 
+  /** Detach the in-flight request (if any) so it can be settled, and free the worker for the next one. */
+  private takePending(): PendingRequest | null {
+    const pending = this.pending;
+    if (pending?.timer) clearTimeout(pending.timer);
+    this.pending = null;
+    this.busy = false;
+    return pending;
+  }
+
+  /** Reject a request that ran past its timeout and kill the (presumably hung) worker. */
+  private timeoutRequest(pending: PendingRequest, timeoutMs: number): void {
+    if (this.pending !== pending) return;
+    this.takePending();
+    console.error(`[${this.label}] Request timed out after ${timeoutMs}ms — killing worker`);
+    pending.reject(new Error(`Worker request timed out after ${timeoutMs}ms`));
+
+    // The next request re-spawns a fresh worker
+    this.cleanup();
+    this.processQueue();
+  }
+
   /** Spawn the Python worker process. */
   private spawn(): void {
-    console.log(`[${this.label}] Spawning worker: python ${this.scriptPath}`);
+    console.log(`[${this.label}] Spawning worker: python ${[this.scriptPath, ...this.scriptArgs].join(' ')}`);
 
-    this.process = spawn('python', [this.scriptPath], {
+    const child = spawn('python', [this.scriptPath, ...this.scriptArgs], {
       stdio: ['pipe', 'pipe', 'pipe'],
       // Windows needs shell: false (default) for proper stdin/stdout piping
     });
+    this.process = child;
 
-    // Read stdout line by line — each line is one JSON response
-    this.readline = createInterface({ input: this.process.stdout! });
+    // Read stdout line by line — each line is one JSON response (or one part of a streamed one)
+    this.readline = createInterface({ input: child.stdout! });
     this.readline.on('line', (line: string) => {
-      if (!this.pending) return;
+      // Ignore a worker that was already replaced (killed after a timeout)
+      if (this.process !== child || !this.pending) return;
 
-      const { resolve, reject } = this.pending;
-      this.pending = null;
-      this.busy = false;
+      const { resolve, reject, onPartial } = this.pending;
 
+      let result: Record<string, unknown> | null = null;
       try {
-        const result = JSON.parse(line) as Record<string, unknown>;
-        if (result.error) {
-          reject(new Error(`Worker error: ${result.error}`));
-        } else {
-          resolve(result);
+        result = JSON.parse(line) as Record<string, unknown>;
+      } catch { /* reported below */ }
+
+      // Intermediate line of a streamed response — keep the request open
+      if (result && onPartial && !result.error && !('summary' in result)) {
+        try {
+          onPartial(result);
+        } catch (err) {
+          console.error(`[${this.label}] Partial response handler failed:`, err);
         }
-      } catch {
+        return;
+      }
+
+      this.takePending();
+
+      if (!result) {
         reject(new Error(`Failed to parse worker response: ${line.slice(0, 200)}`));
+      } else if (result.error) {
+        reject(new Error(`Worker error: ${result.error}`));
+      } else {
+        resolve(result);
       }
 
       // Process next queued request
@@ -103,22 +176,22 @@ export class WorkerManager {
     });
 
     // Log stderr (Python warnings, model loading messages)
-    const stderrRl = createInterface({ input: this.process.stderr! });
+    const stderrRl = createInterface({ input: child.stderr! });
     stderrRl.on('line', (line: string) => {
       console.log(`[${this.label}] ${line}`);
     });
 
     // Handle process exit
-    this.process.on('exit', (code, signal) => {
+    child.on('exit', (code, signal) => {
       console.log(`[${this.label}] Worker exited (code=${code}, signal=${signal})`);
+      // Deliberate shutdown (idle, timeout) — the manager has already moved on
+      if (this.process !== child) return;
       this.cleanup();
 
       // Reject any pending request
-      if (this.pending) {
-        const { reject } = this.pending;
-        this.pending = null;
-        this.busy = false;
-        reject(new Error(`Worker process exited unexpectedly (code=${code})`));
+      const pending = this.takePending();
+      if (pending) {
+        pending.reject(new Error(`Worker process exited unexpectedly (code=${code})`));
       }
 
       // Reject all queued requests
@@ -128,15 +201,14 @@ export class WorkerManager {
       this.queue = [];
     });
 
-    this.process.on('error', (err) => {
+    child.on('error', (err) => {
       console.error(`[${this.label}] Worker spawn error:`, err);
+      if (this.process !== child) return;
       this.cleanup();
 
-      if (this.pending) {
-        const { reject } = this.pending;
-        this.pending = null;
-        this.busy = false;
-        reject(err);
+      const pending = this.takePending();
+      if (pending) {
+        pending.reject(err);
       }
     });
   }
@@ -159,6 +231,16 @@ export class WorkerManager {
       this.idleTimer = null;
     }
     this.cleanup();
+
+    // The killed process's exit is ignored, so fail in-flight and queued work here
+    const pending = this.takePending();
+    if (pending) {
+      pending.reject(new Error('Worker shut down'));
+    }
+    for (const { reject } of this.queue) {
+      reject(new Error('Worker shut down'));
+    }
+    this.queue = [];
   }
 
   /** Clean up process references. */
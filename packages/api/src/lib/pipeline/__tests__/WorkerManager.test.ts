@@ -0,0 +1,102 @@
+import { describe, it, expect, beforeAll, afterAll } from 'vitest';
+import { WorkerManager } from '../WorkerManager';
+import fs from 'fs';
+import path from 'path';
+import os from 'os';
+
+// Stub NDJSON worker: answers each request line according to its "mode"
+const STUB_WORKER = `
+import json, sys, time
+
+for line in sys.stdin:
+    request = json.loads(line)
+    mode = request["mode"]
+    tag = request.get("tag", "")
+    if mode == "plain":
+        reply = [{"ok": True, "tag": tag}]
+    elif mode == "stream":
+        reply = [{"page": i + 1, "text": f"{tag} page {i + 1}"} for i in range(request["pages"])]
+        reply.append({"summary": {"totalPages": request["pages"]}})
+    elif mode == "fail":
+        reply = [{"page": 1, "text": f"{tag} page 1"}, {"error": "boom"}]
+    elif mode == "hang":
+        time.sleep(60)
+        reply = []
+    for obj in reply:
+        sys.stdout.write(json.dumps(obj) + "\\n")
+        sys.stdout.flush()
+`;
+
+let tempDir: string;
+let scriptPath: string;
+let worker: WorkerManager;
+
+beforeAll(() => {
+  tempDir = fs.mkdtempSync(path.join(os.tmpdir(), 'worker-manager-test-'));
+  scriptPath = path.join(tempDir, 'stub_worker.py');
+  fs.writeFileSync(scriptPath, STUB_WORKER);
+  worker = new WorkerManager(scriptPath, 'stub');
+});
+
+afterAll(() => {
+  worker.shutdown();
+  fs.rmSync(tempDir, { recursive: true, force: true });
+});
+
+describe('WorkerManager', () => {
+  it('resolves on the first line when no partial handler is given', async () => {
+    const result = await worker.request({ mode: 'plain', tag: 'a' });
+
+    expect(result).toEqual({ ok: true, tag: 'a' });
+  }, 30_000);
+
+  it('forwards partial lines and resolves on the summary line', async () => {
+    const partials: Record<string, unknown>[] = [];
+    const result = await worker.request({ mode: 'stream', pages: 3, tag: 'a' }, (line) => partials.push(line));
+
+    expect(partials).toEqual([
+      { page: 1, text: 'a page 1' },
+      { page: 2, text: 'a page 2' },
+      { page: 3, text: 'a page 3' },
+    ]);
+    expect(result).toEqual({ summary: { totalPages: 3 } });
+  }, 30_000);
+
+  it('rejects on an error line mid-stream', async () => {
+    const partials: Record<string, unknown>[] = [];
+    const pending = worker.request({ mode: 'fail', tag: 'a' }, (line) => partials.push(line));
+
+    await expect(pending).rejects.toThrow('Worker error: boom');
+    expect(partials).toEqual([{ page: 1, text: 'a page 1' }]);
+  }, 30_000);
+
+  it('keeps a queued request waiting until the streamed one finishes', async () => {
+    const first: Record<string, unknown>[] = [];
+    const second: Record<string, unknown>[] = [];
+    const [a, b] = await Promise.all([
+      worker.request({ mode: 'stream', pages: 2, tag: 'a' }, (line) => first.push(line)),
+      worker.request({ mode: 'stream', pages: 1, tag: 'b' }, (line) => second.push(line)),
+    ]);
+
+    expect(first).toEqual([
+      { page: 1, text: 'a page 1' },
+      { page: 2, text: 'a page 2' },
+    ]);
+    expect(second).toEqual([{ page: 1, text: 'b page 1' }]);
+    expect(a).toEqual({ summary: { totalPages: 2 } });
+    expect(b).toEqual({ summary: { totalPages: 1 } });
+  }, 30_000);
+
+  it('kills a hung worker on request timeout and serves the next request from a fresh one', async () => {
+    const timed = new WorkerManager(scriptPath, 'stub-timeout', undefined, [], 1_000);
+    try {
+      const hung = timed.request({ mode: 'hang' });
+      const next = timed.request({ mode: 'plain', tag: 'after' });
+
+      await expect(hung).rejects.toThrow('timed out');
+      expect(await next).toEqual({ ok: true, tag: 'after' });
+    } finally {
+      timed.shutdown();
+    }
+  }, 30_000);
+});
@@ -8,6 +8,7 @@ layout — items and prices on the same line — for the downstream LLM.
 The model is loaded ONCE and reused for all pages.
 
 Usage: python paddle_ocr.py <image_dir>
+       python paddle_ocr.py --daemon
 
 Outputs JSON to stdout:
 {
@@ -15,10 +16,26 @@ Outputs JSON to stdout:
   "pages": ["page1 text", ...],
   "totalPages": N
 }
+
+With --daemon the model is loaded once and the process stays alive, reading
+one JSON request per line from stdin ({"imageDir": "/abs/path"}) — managed by
+WorkerManager.ts. Each request is answered as NDJSON, one line per page as
+soon as that page finishes (pages may arrive out of order), then a summary:
+{"page": 1, "text": "page1 text"}
+...
+{"summary": {"totalPages": N}}
+A failed request ends with {"error": "..."} instead of the summary.
 """
+import functools
+import gc
+import io
 import json
 import os
+import queue
+import re
 import sys
+import threading
+from typing import Callable
 
 # Suppress OpenMP duplicate library warning
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
@@ -35,118 +52,760 @@ logging.getLogger("paddle").setLevel(logging.ERROR)
 # Minimum confidence to include a line
 MIN_CONFIDENCE = 0.30
 
+# Decoded pages buffered ahead of the OCR thread (bounds memory on long PDFs)
+DECODE_QUEUE_SIZE = 4
+
+# Pages per batched OCR call
+OCR_BATCH_SIZE = 4
+
+# On CPU, force a garbage collection after this many pages so PIL/numpy
+# intermediates from finished batches don't pile up on long documents
+GC_EVERY_PAGES = 16
+
+# Fragments within this many pixels of a row's first fragment share its line
+ROW_THRESHOLD = 50
 
-def build_clean_text(fragments: list[tuple[str, int, int]]) -> str:
-    """Build clean formatted text from (text, y, x) fragments.
+# Rendered page images: page_1.png, page_2.png, ...
+PAGE_IMAGE_RE = re.compile(r"^page_(\d+)\.png$")
+
+
+def find_page_images(image_dir: str) -> list[str]:
+    """Find page_N.png images in page order with a single directory scan.
+
+    Stops at the first missing page number, like page_1, page_2, ... probing.
+    """
+    numbered = []
+    with os.scandir(image_dir) as entries:
+        for entry in entries:
+            m = PAGE_IMAGE_RE.match(entry.name)
+            if m and entry.is_file():
+                numbered.append((int(m.group(1)), entry.path))
+    numbered.sort()
+
+    images = []
+    for expected, (page_num, img_path) in enumerate(numbered, 1):
+        if page_num != expected:
+            break
+        images.append(img_path)
+    return images
+
+
+def _group_rows_loop(ys_sorted, threshold, out) -> None:
+    """Fill out with a row id per fragment; a row ends at the first y >= its anchor + threshold.
+
+    A plain integer loop over the sorted y's, compiled with Numba when it's
+    available — no NumPy calls inside so it stays nopython-compatible.
+    """
+    rid = 0
+    anchor = ys_sorted[0]
+    for i in range(ys_sorted.size):
+        if ys_sorted[i] - anchor >= threshold:
+            rid += 1
+            anchor = ys_sorted[i]
+        out[i] = rid
+
+
+def _group_rows_searchsorted(ys_sorted, threshold, out) -> None:
+    """NumPy fallback for _group_rows_loop: one binary search per row."""
+    import numpy as np
+
+    n = ys_sorted.size
+    start = 0
+    rid = 0
+    while start < n:
+        end = int(np.searchsorted(ys_sorted, ys_sorted[start] + threshold, side="left"))
+        out[start:end] = rid
+        rid += 1
+        start = end
+
+
+@functools.cache
+def row_grouper():
+    """The fastest available row grouper: Numba-compiled loop, else NumPy.
+
+    Numba is optional. cache=True keeps the compiled loop on disk, so only
+    the first run on a machine pays the compile cost. njit compiles lazily,
+    so the loop is run once here on a tiny array: if compiling (or writing
+    the cache) fails, we fall back to NumPy instead of failing every page.
+    """
+    try:
+        import numpy as np
+        from numba import njit
+
+        grouper = njit(cache=True)(_group_rows_loop)
+        probe = np.array([0, 10, 100], dtype=np.int32)
+        grouper(probe, ROW_THRESHOLD, np.empty(probe.size, dtype=np.int32))
+    except Exception as e:
+        if not isinstance(e, ImportError):
+            sys.stderr.write(f"paddle_ocr: numba row grouping unavailable ({e}), using NumPy\n")
+            sys.stderr.flush()
+        return _group_rows_searchsorted
+    return grouper
+
+
+def build_clean_text(fragments: dict) -> str:
+    """Build clean formatted text from {"texts", "ys", "xs"} fragment arrays.
 
     Groups fragments by y-position (same-row items), then joins them
     into single lines separated by spaces. This produces a document
     where items and their prices appear on the same line — exactly
     what an LLM expects for invoice parsing.
     """
-    if not fragments:
+    import numpy as np
+
+    texts = fragments["texts"]
+    if not texts:
         return "[No text detected]"
 
-    # Sort by y then x
-    fragments.sort(key=lambda f: (f[1], f[2]))
+    ys = fragments["ys"]
+    xs = fragments["xs"]
 
-    # Group into rows: fragments within ROW_THRESHOLD pixels of each other
-    ROW_THRESHOLD = 50
-    rows: list[list[tuple[str, int, int]]] = []
-    for text, y, x in fragments:
-        if rows and abs(y - rows[-1][0][1]) < ROW_THRESHOLD:
-            rows[-1].append((text, y, x))
-        else:
-            rows.append([(text, y, x)])
+    # Sort by y then x — only the two int32 arrays are touched
+    order = np.lexsort((xs, ys))
+    ys_sorted = ys[order]
 
-    # Sort each row by x-position, then join into single lines
-    output_lines = []
-    for row in rows:
-        row.sort(key=lambda f: f[2])
-        line = "    ".join(f[0] for f in row)
-        output_lines.append(line)
+    # Group into rows: a row holds every fragment within ROW_THRESHOLD pixels
+    # of its first (topmost) fragment
+    row_id = np.empty(len(texts), dtype=np.int32)
+    row_grouper()(ys_sorted, ROW_THRESHOLD, row_id)
 
-    return "\n".join(output_lines)
+    # Sort each row by x-position (stable, so ties keep y order), then join
+    # into single lines
+    within = np.lexsort((xs[order], row_id))
+    order = order[within]
+    bounds = np.flatnonzero(np.diff(row_id[within])) + 1
+    buf = io.StringIO()
+    for r, row in enumerate(np.split(order, bounds)):
+        if r:
+            buf.write("\n")
+        buf.write("    ".join(texts[i] for i in row))
 
+    return buf.getvalue()
 
-def extract(image_dir: str) -> dict:
-    """Run PaddleOCR on all page images, produce clean text.
 
-    Uses the lightweight PaddleOCR class (det + rec only) instead of the
-    heavy PPStructureV3 pipeline, which loads ~7 models and needs >4GB RAM.
+def cuda_available() -> bool:
+    """Whether Paddle was built with CUDA and can see at least one GPU."""
+    try:
+        import paddle
+        return paddle.device.is_compiled_with_cuda() and paddle.device.cuda.device_count() > 0
+    except Exception:
+        return False
+
+
+def empty_gpu_cache() -> None:
+    """Return Paddle's cached GPU blocks to the allocator (no-op without CUDA)."""
+    try:
+        import paddle
+        paddle.device.cuda.empty_cache()
+    except Exception:
+        pass
+
+
+def load_ocr(device: str | None = None, cpu_threads: int | None = None):
+    """Load PaddleOCR on the fastest inference backend available.
+
+    enable_hpi lets PaddleX pick OpenVINO / ONNX Runtime / TensorRT for the
+    host, with FP16 on GPU (CPU kernels gain nothing from half precision).
+    If the high-performance inference plugin isn't installed we fall back to
+    the default Paddle Inference backend. A dummy page is run once so kernel
+    selection and autotuning happen here rather than on the first real page.
     """
     from paddleocr import PaddleOCR
-    from PIL import Image
+    import numpy as np
+
+    if device is None:
+        device = "gpu" if cuda_available() else "cpu"
+    base_kwargs = {
+        "lang": "en",
+        # Invoices are single-orientation documents: one page-level
+        # orientation pass replaces the per-text-line angle classifier.
+        # Pages come from gs_render / image_to_pages, so they are flat and
+        # don't need UVDoc. Page orientation stays on because this legacy
+        # tier reads the raw page_N.png, not vlm_preprocess output.
+        "use_doc_orientation_classify": True,
+        "use_doc_unwarping": False,
+        "use_textline_orientation": False,
+        "device": device,
+        "cpu_threads": cpu_threads or os.cpu_count() or 1,
+    }
 
-    # Find page images in order
-    images = []
-    page_num = 1
-    while True:
-        img_path = os.path.join(image_dir, f"page_{page_num}.png")
-        if not os.path.exists(img_path):
-            break
-        images.append(img_path)
-        page_num += 1
+    try:
+        ocr = PaddleOCR(
+            **base_kwargs,
+            enable_hpi=True,
+            precision="fp16" if device.startswith("gpu") else "fp32",
+        )
+    except Exception as e:
+        sys.stderr.write(f"paddle_ocr: high-performance inference unavailable ({e}), using default backend\n")
+        sys.stderr.flush()
+        ocr = PaddleOCR(**base_kwargs)
 
-    if not images:
-        raise FileNotFoundError(f"No page_*.png images found in {image_dir}")
+    if hasattr(ocr, "predict"):
+        try:
+            list(ocr.predict(np.zeros((960, 960, 3), np.uint8)))
+        except Exception:
+            pass  # warmup is best effort
+
+    return ocr
 
-    # Load PaddleOCR ONCE for all pages
-    ocr = PaddleOCR(lang="en", use_angle_cls=True)
 
-    page_texts: list[str] = []
+def fragments_from_result(ocr_result) -> dict:
+    """Pull text fragments out of one page's OCR result.
 
-    for img_path in images:
+    Returns parallel arrays {"texts": [...], "ys": int32[], "xs": int32[]}
+    holding each fragment's text and top-left corner, so sorting and row
+    grouping work on compact int arrays rather than tuples of boxed ints.
+    Texts are interned: headers and footers repeated on every page of an
+    invoice then share one string object.
+
+    PaddleOCR v3+ returns an OCRResult dict with rec_texts, rec_scores, dt_polys;
+    older versions returned [[box, (text, score)], ...].
+    """
+    import numpy as np
+
+    texts: list[str] = []
+    if hasattr(ocr_result, "keys") and "rec_texts" in ocr_result:
+        rec_texts = ocr_result["rec_texts"]
+        dt_polys = ocr_result["dt_polys"]
+        n = min(len(rec_texts), len(ocr_result["rec_scores"]), len(dt_polys))
+        if n == 0:
+            return {"texts": texts, "ys": np.empty(0, np.int32), "xs": np.empty(0, np.int32)}
+
+        # One reduction over all boxes: (N, 4, 2) polys → (N, 2) top-left corners
+        if isinstance(dt_polys, np.ndarray) and dt_polys.ndim == 3:
+            mins = dt_polys[:n].min(axis=1)
+        else:
+            mins = np.array([np.min(p, axis=0) for p in dt_polys[:n]]).reshape(-1, 2)
+        mins = mins.astype(np.int32)
+        scores = np.asarray(ocr_result["rec_scores"][:n], dtype=np.float64)
+
+        keep = []
+        for i in np.flatnonzero(scores >= MIN_CONFIDENCE):
+            text = rec_texts[i].strip()
+            if text:
+                texts.append(sys.intern(text))
+                keep.append(i)
+        mins = mins[keep]
+        return {"texts": texts, "ys": mins[:, 1].copy(), "xs": mins[:, 0].copy()}
+
+    ys: list[int] = []
+    xs: list[int] = []
+    for line in ocr_result:
+        box, (text, score) = line
+        if score < MIN_CONFIDENCE or not text.strip():
+            continue
+        texts.append(sys.intern(text.strip()))
+        xs.append(int(min(p[0] for p in box)))
+        ys.append(int(min(p[1] for p in box)))
+    return {"texts": texts, "ys": np.array(ys, dtype=np.int32), "xs": np.array(xs, dtype=np.int32)}
+
+
+def ocr_pages(ocr, batch: list[tuple[int, object]]) -> list[tuple[int, object]]:
+    """Run OCR over a batch of (page_idx, BGR array) pairs.
+
+    PaddleOCR 3.x's predict() accepts a list and runs det + rec over the whole
+    batch in one call; legacy 2.x only takes one image per ocr() call. Returns
+    (page_idx, page_result) pairs — page_result is an Exception if that page
+    failed. If the batched call fails, or returns a different number of
+    results than pages, pages are retried one at a time so a single bad page
+    doesn't take its neighbours down with it.
+    """
+    has_predict = hasattr(ocr, "predict")
+    if has_predict and len(batch) > 1:
+        try:
+            results = list(ocr.predict([arr for _, arr in batch]))
+            if len(results) == len(batch):
+                return [(page_idx, res) for (page_idx, _), res in zip(batch, results)]
+        except Exception:
+            pass  # retry page by page below
+
+    out = []
+    for page_idx, arr in batch:
         try:
-            result = ocr.ocr(img_path)
-            if not result or not result[0]:
-                page_texts.append("[No OCR results]")
+            result = list(ocr.predict(arr)) if has_predict else ocr.ocr(arr)
+            out.append((page_idx, result[0] if result else None))
+        except Exception as e:
+            out.append((page_idx, e))
+    return out
+
+
+def run_pipeline(ocr, next_page, on_page, batch_size: int = OCR_BATCH_SIZE) -> None:
+    """OCR pages pulled from next_page(), reporting each via on_page(page_idx, text).
+
+    next_page() returns (page_idx, img_path), or None once there is no more
+    work. Pages flow through three threads connected by queues:
+      decode (PIL → ndarray) → OCR (batched inference) → format (clean text)
+    so image decoding and text layout overlap with model inference instead
+    of waiting behind it. Only the OCR thread touches the PaddleOCR instance.
+
+    A per-page failure becomes that page's text. If a stage itself dies, the
+    other stages are stopped and the exception is re-raised here.
+    """
+    from PIL import Image
+    import numpy as np
+
+    # Items are (page_idx, payload); payload is an Exception when a stage failed.
+    # None marks end-of-stream.
+    q_decoded: queue.Queue = queue.Queue(maxsize=max(DECODE_QUEUE_SIZE, batch_size))
+    q_results: queue.Queue = queue.Queue()
+
+    # Set once any stage dies, so the others stop instead of blocking on a
+    # queue nobody will ever drain or fill again
+    stop = threading.Event()
+    errors: list[BaseException] = []
+
+    def put(q: queue.Queue, item) -> None:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
                 continue
 
-            ocr_result = result[0]
-
-            # PaddleOCR v3+ returns OCRResult dict with rec_texts, rec_scores, dt_polys
-            # Older versions returned [[box, (text, score)], ...]
-            if hasattr(ocr_result, "keys") and "rec_texts" in ocr_result:
-                rec_texts = ocr_result["rec_texts"]
-                rec_scores = ocr_result["rec_scores"]
-                dt_polys = ocr_result["dt_polys"]
-                fragments = []
-                for text, score, poly in zip(rec_texts, rec_scores, dt_polys):
-                    if score < MIN_CONFIDENCE or not text.strip():
+    def get(q: queue.Queue):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def stage(fn):
+        def target() -> None:
+            failed = True
+            try:
+                fn()
+                failed = False
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                if failed:
+                    stop.set()
+        return target
+
+    def decode_stage() -> None:
+        try:
+            while not stop.is_set() and (task := next_page()) is not None:
+                page_idx, img_path = task
+                try:
+                    rgb = np.asarray(Image.open(img_path).convert("RGB"))
+                    # PaddleOCR expects BGR arrays, same as cv2.imread
+                    put(q_decoded, (page_idx, np.ascontiguousarray(rgb[:, :, ::-1])))
+                except Exception as e:
+                    put(q_decoded, (page_idx, e))
+        finally:
+            put(q_decoded, None)
+
+    def ocr_stage() -> None:
+        # Pages are grouped into batches of identical shape (same render DPI
+        # and orientation) so the detector never pads to a mismatched size.
+        # A page that doesn't fit the current batch starts the next one.
+        # Between batches the thread drops its references to decoded pages
+        # and raw results and frees Paddle's caches, so long documents
+        # don't grow GPU/host memory page after page.
+        on_gpu = cuda_available()
+        pages_since_gc = 0
+        carry = None
+        done = False
+        try:
+            while not done:
+                batch: list[tuple[int, object]] = []
+                while len(batch) < batch_size:
+                    if carry is not None:
+                        item, carry = carry, None
+                    else:
+                        item = get(q_decoded)
+                    if item is None:
+                        done = True
+                        break
+                    page_idx, arr = item
+                    if isinstance(arr, Exception):
+                        put(q_results, item)
                         continue
-                    x_min = int(min(p[0] for p in poly))
-                    y_min = int(min(p[1] for p in poly))
-                    fragments.append((text.strip(), y_min, x_min))
+                    if batch and arr.shape != batch[0][1].shape:
+                        carry = item
+                        break
+                    batch.append(item)
+                if not batch:
+                    continue
+                results = ocr_pages(ocr, batch)
+                pages_since_gc += len(batch)
+                del batch
+                for page_idx, result in results:
+                    put(q_results, (page_idx, result))
+                del results
+                if on_gpu:
+                    empty_gpu_cache()
+                elif pages_since_gc >= GC_EVERY_PAGES:
+                    gc.collect()
+                    pages_since_gc = 0
+        finally:
+            put(q_results, None)
+
+    def format_stage() -> None:
+        while (item := get(q_results)) is not None:
+            page_idx, result = item
+            if isinstance(result, Exception):
+                on_page(page_idx, f"[PaddleOCR extraction failed: {result}]")
+                continue
+            if not result:
+                on_page(page_idx, "[No OCR results]")
+                continue
+            try:
+                on_page(page_idx, build_clean_text(fragments_from_result(result)))
+            except Exception as e:
+                on_page(page_idx, f"[PaddleOCR extraction failed: {e}]")
+
+    stages = [
+        threading.Thread(target=stage(decode_stage), name="paddle-decode", daemon=True),
+        threading.Thread(target=stage(ocr_stage), name="paddle-ocr", daemon=True),
+        threading.Thread(target=stage(format_stage), name="paddle-format", daemon=True),
+    ]
+    for t in stages:
+        t.start()
+    for t in stages:
+        t.join()
+
+    if errors:
+        raise errors[0]
+
+
+def default_worker_count() -> int:
+    """One worker per GPU; a single in-process worker on CPU.
+
+    Every worker loads and warms up its own model, and the host runs one
+    OCR job at a time on limited RAM — so CPU hosts only get more workers
+    when PADDLE_OCR_WORKERS asks for them.
+    """
+    if cuda_available():
+        import paddle
+        return max(1, paddle.device.cuda.device_count())
+    return 1
+
+
+def _worker_main(worker_id: int, num_workers: int, task_q, result_q, start_q, batch_size: int) -> None:
+    """Process entry point: load a private PaddleOCR once, then serve requests.
+
+    Each worker gets its own GPU when there are enough, otherwise an even
+    share of the CPU cores. Messages to the parent on result_q are tagged
+    tuples: ("ready", id) once the model is loaded, ("page", page_idx, text)
+    per page, ("error", id, message) when model loading or a request fails,
+    and ("done", id) at the end of each request. Every True on start_q begins
+    one request (drain the shared task queue); False shuts the worker down.
+    """
+    try:
+        cpu_threads = None
+        if cuda_available():
+            import paddle
+            device = f"gpu:{worker_id % paddle.device.cuda.device_count()}"
+        else:
+            device = "cpu"
+            if hasattr(os, "sched_setaffinity"):
+                cpus = sorted(os.sched_getaffinity(0))
+                share = max(1, len(cpus) // num_workers)
+                mine = cpus[worker_id * share:(worker_id + 1) * share] or cpus
+                os.sched_setaffinity(0, mine)
+                cpu_threads = len(mine)
             else:
-                # Legacy format: [[box, (text, score)], ...]
-                fragments = []
-                for line in ocr_result:
-                    box, (text, score) = line
-                    if score < MIN_CONFIDENCE or not text.strip():
-                        continue
-                    x_min = int(min(p[0] for p in box))
-                    y_min = int(min(p[1] for p in box))
-                    fragments.append((text.strip(), y_min, x_min))
+                cpu_threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+        ocr = load_ocr(device, cpu_threads=cpu_threads)
+    except Exception as e:
+        sys.stderr.write(f"paddle_ocr: worker {worker_id} failed to load PaddleOCR ({e})\n")
+        sys.stderr.flush()
+        # Send a plain message: the original exception may not survive pickling
+        result_q.put(("error", worker_id, f"PaddleOCR worker {worker_id} failed: {e}"))
+        return
 
-            page_text = build_clean_text(fragments)
-            page_texts.append(page_text)
+    result_q.put(("ready", worker_id))
 
+    def next_page():
+        try:
+            return task_q.get_nowait()
+        except queue.Empty:
+            return None
+
+    while start_q.get():
+        try:
+            run_pipeline(ocr, next_page, lambda idx, text: result_q.put(("page", idx, text)), batch_size)
         except Exception as e:
-            page_texts.append(f"[PaddleOCR extraction failed: {e}]")
+            sys.stderr.write(f"paddle_ocr: worker {worker_id} failed ({e})\n")
+            sys.stderr.flush()
+            result_q.put(("error", worker_id, f"PaddleOCR worker {worker_id} failed: {e}"))
+        finally:
+            result_q.put(("done", worker_id))
+
+
+class OcrWorkerPool:
+    """Persistent PaddleOCR worker processes, each with its own model loaded once.
+
+    Pages of a request go onto a shared queue and every live worker drains
+    it, so one request spreads over all devices. The pool outlives requests:
+    daemon mode keeps it for the life of the process, so each worker pays
+    its model load once rather than once per invoice.
+
+    Workers are started with "spawn", never "fork": the parent may already
+    have initialised CUDA, which forked children can't safely reuse.
+    """
 
-    full_text = "\n\n---\n\n".join(page_texts)
+    def __init__(self, workers: int, batch_size: int = OCR_BATCH_SIZE):
+        import multiprocessing
+
+        ctx = multiprocessing.get_context("spawn")
+        self._manager = ctx.Manager()
+        self._task_q = self._manager.Queue()
+        self._result_q = self._manager.Queue()
+        self._start_qs = [self._manager.Queue() for _ in range(workers)]
+        self._procs = [
+            ctx.Process(
+                target=_worker_main,
+                args=(i, workers, self._task_q, self._result_q, self._start_qs[i], batch_size),
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+        for p in self._procs:
+            p.start()
+
+        # Wait until every worker has either loaded its model or given up
+        self.live: list[int] = []
+        failures: list[str] = []
+        waiting = set(range(workers))
+        while waiting:
+            item = self._next_result(waiting)
+            if item is None:
+                continue
+            if item[0] == "ready":
+                self.live.append(item[1])
+            elif item[0] == "error":
+                failures.append(item[2])
+            waiting.discard(item[1])
+
+        if not self.live:
+            self.close()
+            raise RuntimeError(failures[0] if failures else "No PaddleOCR worker could start")
+
+    def _next_result(self, waiting: set[int]):
+        """Next result_q message, or None after a timeout (dropping workers that died hard)."""
+        try:
+            return self._result_q.get(timeout=1.0)
+        except queue.Empty:
+            for worker_id in list(waiting):
+                if not self._procs[worker_id].is_alive():
+                    waiting.discard(worker_id)
+                    if worker_id in self.live:
+                        self.live.remove(worker_id)
+            return None
+
+    def run(self, images: list[str], on_page: Callable[[int, str], None]) -> None:
+        """OCR one request's page images on every live worker.
+
+        on_page(page_idx, text) is called in completion order. Raises if no
+        worker is left, or if every worker failed this request.
+        """
+        if not self.live:
+            raise RuntimeError("No PaddleOCR worker is running")
+
+        for task in enumerate(images):
+            self._task_q.put(task)
+        started = list(self.live)
+        for worker_id in started:
+            self._start_qs[worker_id].put(True)
+
+        failures: list[str] = []
+        waiting = set(started)
+        while waiting:
+            item = self._next_result(waiting)
+            if item is None:
+                continue
+            if item[0] == "page":
+                on_page(item[1], item[2])
+            elif item[0] == "error":
+                failures.append(item[2])
+            elif item[0] == "done":
+                waiting.discard(item[1])
+
+        # Pages a crashed worker never took must not leak into the next request
+        while True:
+            try:
+                self._task_q.get_nowait()
+            except queue.Empty:
+                break
+
+        if len(failures) == len(started):
+            raise RuntimeError(failures[0])
+        if not self.live:
+            raise RuntimeError("All PaddleOCR workers exited during the request")
+
+    def close(self) -> None:
+        """Stop the workers and the queue manager."""
+        for worker_id in self.live:
+            self._start_qs[worker_id].put(False)
+        for p in self._procs:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+        self._manager.shutdown()
+
+
+def extract(
+    image_dir: str,
+    workers: int | None = None,
+    batch_size: int | None = None,
+    ocr=None,
+    on_page: Callable[[int, str], None] | None = None,
+    pool: OcrWorkerPool | None = None,
+) -> dict:
+    """Run PaddleOCR on all page images, produce clean text.
+
+    Uses the lightweight PaddleOCR class (det + rec only) instead of the
+    heavy PPStructureV3 pipeline, which loads ~7 models and needs >4GB RAM.
+
+    Pages are independent, so with more than one worker each process loads
+    its own model and pulls pages from a shared queue (see OcrWorkerPool).
+    A single worker (the default on CPU) runs in-process with no spawn
+    overhead. Worker count and batch size default to PADDLE_OCR_WORKERS /
+    PADDLE_OCR_BATCH_SIZE when set. Daemon mode passes what it loaded once:
+    an ocr runs in-process on that model, a pool runs on its workers.
+    on_page(page_idx, text) is called as each page completes, in completion
+    order, so callers can stream.
+    """
+    # Find page images in order
+    images = find_page_images(image_dir)
+
+    if not images:
+        raise FileNotFoundError(f"No page_*.png images found in {image_dir}")
+
+    page_texts: dict[int, str] = {}
+
+    def page_done(page_idx: int, text: str) -> None:
+        page_texts[page_idx] = text
+        if on_page is not None:
+            on_page(page_idx, text)
+
+    if pool is not None:
+        pool.run(images, page_done)
+    else:
+        if batch_size is None:
+            batch_size = int(os.environ.get("PADDLE_OCR_BATCH_SIZE") or OCR_BATCH_SIZE)
+        if ocr is None:
+            if workers is None:
+                workers = int(os.environ.get("PADDLE_OCR_WORKERS") or default_worker_count())
+            workers = max(1, min(workers, len(images)))
+
+        if ocr is not None or workers == 1:
+            # Load PaddleOCR ONCE for all pages
+            if ocr is None:
+                ocr = load_ocr()
+            tasks = iter(list(enumerate(images)))
+            run_pipeline(ocr, lambda: next(tasks, None), page_done, batch_size)
+        else:
+            pool = OcrWorkerPool(workers, batch_size)
+            try:
+                pool.run(images, page_done)
+            finally:
+                pool.close()
+
+    # Pages lost with a crashed worker still get a (failed) entry
+    for i in range(len(images)):
+        if i not in page_texts:
+            page_done(i, "[PaddleOCR extraction failed: page not processed]")
+
+    # Index by page rather than completion order so output order is stable
+    ordered = [page_texts[i] for i in range(len(images))]
+    buf = io.StringIO()
+    for i, page_text in enumerate(ordered):
+        if i:
+            buf.write("\n\n---\n\n")
+        buf.write(page_text)
+    full_text = buf.getvalue()
 
     return {
         "fullText": full_text,
-        "pages": page_texts,
+        "pages": ordered,
         "totalPages": len(images),
     }
 
 
+def claim_stdout():
+    """Reserve the real stdout for protocol responses; send all other output to stderr.
+
+    Paddle and PaddleX print to stdout (some of it from native code), which
+    would otherwise land between NDJSON responses. Returns a text stream on
+    a duplicate of the original stdout; fd 1 and sys.stdout then point at
+    stderr.
+    """
+    sys.stdout.flush()
+    out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    return out
+
+
+def write_json_line(out, obj: dict) -> None:
+    """Write one NDJSON line to out and flush it to the reader immediately."""
+    out.write(json.dumps(obj, ensure_ascii=False) + "\n")
+    out.flush()
+
+
+def run_daemon() -> None:
+    """Load the model(s) once, then serve NDJSON requests from stdin until EOF.
+
+    Pages are written out as they finish rather than as one large response,
+    so the reader can start on early pages while later ones are still OCRing.
+    """
+    out = claim_stdout()
+
+    # More than one worker (one per GPU, or PADDLE_OCR_WORKERS) keeps a
+    # persistent pool so every device serves every request
+    ocr = pool = None
+    workers = int(os.environ.get("PADDLE_OCR_WORKERS") or default_worker_count())
+    if workers > 1:
+        batch_size = int(os.environ.get("PADDLE_OCR_BATCH_SIZE") or OCR_BATCH_SIZE)
+        pool = OcrWorkerPool(workers, batch_size)
+    else:
+        ocr = load_ocr()
+
+    # Signal ready
+    sys.stderr.write("paddle_ocr daemon ready\n")
+    sys.stderr.flush()
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+            image_dir = request.get("imageDir", "")
+
+            if not image_dir or not os.path.isdir(image_dir):
+                result = {"error": f"Directory not found: {image_dir}"}
+            else:
+                data = extract(
+                    image_dir,
+                    ocr=ocr,
+                    pool=pool,
+                    on_page=lambda idx, text: write_json_line(out, {"page": idx + 1, "text": text}),
+                )
+                result = {"summary": {"totalPages": data["totalPages"]}}
+
+        except Exception as e:
+            result = {"error": str(e)}
+
+        write_json_line(out, result)
+
+    if pool is not None:
+        pool.close()
+
+
 if __name__ == "__main__":
+    if sys.argv[1:] == ["--daemon"]:
+        run_daemon()
+        sys.exit(0)
+
     if len(sys.argv) != 2:
-        print(json.dumps({"error": "Usage: python paddle_ocr.py <image_dir>"}), file=sys.stderr)
+        print(json.dumps({"error": "Usage: python paddle_ocr.py <image_dir> | --daemon"}), file=sys.stderr)
         sys.exit(1)
 
     image_dir = sys.argv[1]
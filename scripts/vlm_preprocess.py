@@ -4,19 +4,29 @@ Pipeline:
 1. Orientation detection (PP-LCNet_x1_0_doc_ori via PaddleX) — detect 0/90/180/270, auto-rotate
 2. Unwarping (UVDoc via PaddleX) — flatten curved/folded documents
 3. Image enhancement — CLAHE adaptive contrast, denoise, sharpen
-4. Format + Resize (Pillow) — JPEG q90, only scale down if >5MB
+4. Format + Resize (OpenCV) — JPEG q90, only scale down if >5MB
 
 Models are loaded ONCE and reused for all pages.
 
-Usage: python vlm_preprocess.py <image_dir>
+Usage: python vlm_preprocess.py [--skip-unwarp-if-flat] <image_dir>
+       python vlm_preprocess.py --daemon
 
 Outputs preprocessed images as page_N_pre.jpg in the same directory.
 JSON to stdout: { "pages": [{ "page": 1, "file": "page_1_pre.jpg", "rotated": 0, "unwarped": true }] }
+
+With --daemon the models stay loaded between requests: one JSON request per
+line on stdin ({"imageDir": "/abs/path", "skipUnwarpIfFlat": true}), one JSON
+response per line on stdout — managed by WorkerManager.ts.
+
+--skip-unwarp-if-flat (skipUnwarpIfFlat in daemon mode) skips UVDoc on pages
+that already look flat — set for Ghostscript-rendered PDF pages.
 """
 import json
+import math
 import os
+import re
 import sys
-import io
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
@@ -30,37 +40,86 @@ logging.getLogger("paddlex").setLevel(logging.ERROR)
 logging.getLogger("paddle").setLevel(logging.ERROR)
 
 MAX_JPEG_BYTES = 5 * 1024 * 1024  # 5MB VLM API limit
+MIN_JPEG_QUALITY = 60  # floor when trading quality for size before resizing
 
+# Pages per orientation / unwarp batch — bounds memory on long PDFs
+PREPROCESS_BATCH_SIZE = 8
 
-def save_capped_jpeg(img, out_path: str, quality: int = 90) -> None:
-    """Save PIL Image as JPEG, scaling down progressively if >5MB."""
-    from PIL import Image
+# Flat-page heuristic: a page with at least this many long, axis-aligned
+# Hough segments (table rules, text baselines) is treated as already flat
+FLAT_MIN_LINES = 20
+FLAT_MAX_TILT_DEG = 1.0
+
+# Rendered page images: page_1.png, page_2.png, ...
+PAGE_IMAGE_RE = re.compile(r"^page_(\d+)\.png$")
+
+
+def find_page_images(image_dir: str) -> list[str]:
+    """Find page_N.png images in page order with a single directory scan.
+
+    Stops at the first missing page number, like page_1, page_2, ... probing.
+    """
+    numbered = []
+    with os.scandir(image_dir) as entries:
+        for entry in entries:
+            m = PAGE_IMAGE_RE.match(entry.name)
+            if m and entry.is_file():
+                numbered.append((int(m.group(1)), entry.path))
+    numbered.sort()
 
-    if img.mode in ("RGBA", "P"):
-        img = img.convert("RGB")
+    images = []
+    for expected, (page_num, img_path) in enumerate(numbered, 1):
+        if page_num != expected:
+            break
+        images.append(img_path)
+    return images
 
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG", quality=quality)
 
-    while buf.tell() > MAX_JPEG_BYTES:
-        w, h = img.size
-        img = img.resize((int(w * 0.85), int(h * 0.85)), Image.LANCZOS)
-        buf = io.BytesIO()
-        img.save(buf, format="JPEG", quality=quality)
+def save_capped_jpeg(img, out_path: str, quality: int = 90) -> None:
+    """Save a BGR ndarray as JPEG, lowering quality then scaling down if >5MB.
+
+    Encodes with OpenCV (libjpeg-turbo SIMD DCT) rather than Pillow, with
+    optimized Huffman tables and progressive scans for a few % smaller files.
+    An oversize page is first re-encoded once at a quality estimated from the
+    byte ratio — far cheaper than resizing and hardly visible to the VLM.
+    Only if that still doesn't fit is it shrunk, straight to the square root
+    of the byte ratio (JPEG size tracks pixel area) with a small margin.
+    """
+    import cv2
+
+    arr = img
+
+    def encode(a, q):
+        params = [
+            cv2.IMWRITE_JPEG_QUALITY, q,
+            cv2.IMWRITE_JPEG_OPTIMIZE, 1,
+            cv2.IMWRITE_JPEG_PROGRESSIVE, 1,
+        ]
+        ok, buf = cv2.imencode(".jpg", a, params)
+        if not ok:
+            raise RuntimeError(f"JPEG encode failed for {out_path}")
+        return buf
+
+    buf = encode(arr, quality)
+    if buf.nbytes > MAX_JPEG_BYTES:
+        quality = max(MIN_JPEG_QUALITY, int(quality * math.sqrt(MAX_JPEG_BYTES / buf.nbytes)))
+        buf = encode(arr, quality)
+
+    while buf.nbytes > MAX_JPEG_BYTES:
+        scale = math.sqrt(MAX_JPEG_BYTES / buf.nbytes) * 0.95
+        arr = cv2.resize(arr, None, fx=scale, fy=scale, interpolation=cv2.INTER_LANCZOS4)
+        buf = encode(arr, quality)
 
     with open(out_path, "wb") as f:
-        f.write(buf.getvalue())
+        f.write(buf.tobytes())
 
 
-def enhance_image(pil_img):
-    """Enhance image for better OCR: CLAHE contrast, denoise, sharpen."""
+def enhance_image(img_cv):
+    """Enhance a BGR image for better OCR: CLAHE contrast, denoise, sharpen."""
     import cv2
     import numpy as np
     from PIL import Image, ImageEnhance
 
-    # PIL RGB → OpenCV BGR
-    img_cv = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-
     # CLAHE on lightness channel (preserves color)
     lab = cv2.cvtColor(img_cv, cv2.COLOR_BGR2LAB)
     l, a, b = cv2.split(lab)
@@ -75,91 +134,213 @@ def enhance_image(pil_img):
     pil_out = Image.fromarray(cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB))
     pil_out = ImageEnhance.Sharpness(pil_out).enhance(1.5)
     pil_out = ImageEnhance.Contrast(pil_out).enhance(1.1)
-    return pil_out
+    return cv2.cvtColor(np.asarray(pil_out), cv2.COLOR_RGB2BGR)
 
 
-def preprocess(image_dir: str) -> dict:
-    """Run orientation + unwarping + JPEG conversion on all page images."""
-    from paddlex import create_model
-    from PIL import Image
+def is_flat_page(img_bgr) -> bool:
+    """Cheap check for a page with no curvature, e.g. a rasterized PDF page.
+
+    Counts long straight edge segments that are within FLAT_MAX_TILT_DEG of
+    horizontal or vertical; a curved or folded photo breaks these up.
+    """
+    import cv2
     import numpy as np
 
-    # Load models once
-    sys.stderr.write("vlm_preprocess: loading orientation model...\n")
-    sys.stderr.flush()
-    ori_model = create_model("PP-LCNet_x1_0_doc_ori")
+    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 50, 150)
+    lines = cv2.HoughLinesP(
+        edges, 1, np.pi / 180, 200,
+        minLineLength=gray.shape[1] // 3, maxLineGap=20,
+    )
+    if lines is None:
+        return False
 
-    sys.stderr.write("vlm_preprocess: loading UVDoc model...\n")
-    sys.stderr.flush()
-    unwarp_model = create_model("UVDoc")
+    x1, y1, x2, y2 = lines.reshape(-1, 4).T.astype(np.float64)
+    tilt = np.degrees(np.arctan2(np.abs(y2 - y1), np.abs(x2 - x1)))
+    axis_aligned = (tilt <= FLAT_MAX_TILT_DEG) | (tilt >= 90 - FLAT_MAX_TILT_DEG)
+    return int(axis_aligned.sum()) >= FLAT_MIN_LINES
 
-    sys.stderr.write("vlm_preprocess: models loaded\n")
-    sys.stderr.flush()
 
-    # Find page images in order
-    images = []
-    page_num = 1
-    while True:
-        img_path = os.path.join(image_dir, f"page_{page_num}.png")
-        if not os.path.exists(img_path):
-            break
-        images.append(img_path)
-        page_num += 1
+def _check_flat(img_bgr):
+    """is_flat_page() for executor.map — returns the exception instead of raising."""
+    try:
+        return is_flat_page(img_bgr)
+    except Exception as e:
+        return e
 
-    if not images:
-        raise FileNotFoundError(f"No page_*.png images found in {image_dir}")
 
-    pages = []
-    for img_path in images:
-        page_idx = len(pages) + 1
-        info = {"page": page_idx, "rotated": 0, "unwarped": False}
+def read_bgr(img_path: str):
+    """Decode a page image straight to a BGR ndarray (the layout PaddleX uses).
+
+    Reads the bytes with NumPy and decodes them with cv2.imdecode, because
+    cv2.imread can't open non-ASCII paths on Windows (e.g. temp dirs under
+    a user profile with accented characters).
+    """
+    import cv2
+    import numpy as np
 
+    img = cv2.imdecode(np.fromfile(img_path, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError(f"cannot decode {img_path}")
+    return img
+
+
+def _load_bgr(img_path: str):
+    """read_bgr() for executor.map — returns the exception instead of raising."""
+    try:
+        return read_bgr(img_path)
+    except Exception as e:
+        return e
+
+
+def preprocess_batch(
+    img_paths: list[str],
+    first_page: int,
+    image_dir: str,
+    ori_model,
+    unwarp_model,
+    executor: ThreadPoolExecutor,
+    skip_unwarp_if_flat: bool = False,
+) -> list[dict]:
+    """Orient, unwarp and JPEG-encode one batch of consecutive pages.
+
+    Pages are decoded once, concurrently, and orientation runs as a single
+    batched predict over all of them — retried page by page if the batch
+    fails. Pages are then grouped by (rotated)
+    array shape, so mixed page sizes never share a batch, and every group
+    goes through UVDoc as one batch — retried page by page if the batch
+    fails. Pages stay BGR ndarrays from decode to JPEG. The
+    enhance + JPEG stage is CPU-bound and runs on the executor's threads.
+    """
+    import cv2
+    import numpy as np
+
+    infos = [{"page": first_page + i, "rotated": 0, "unwarped": False} for i in range(len(img_paths))]
+    imgs = [None] * len(img_paths)  # None = preprocessing failed, use fallback
+
+    # cv2.rotate codes that undo a detected clockwise rotation of N degrees
+    ccw_rotations = {
+        90: cv2.ROTATE_90_COUNTERCLOCKWISE,
+        180: cv2.ROTATE_180,
+        270: cv2.ROTATE_90_CLOCKWISE,
+    }
+
+    # Read + decode the whole batch concurrently; both models then work from
+    # these arrays instead of each re-reading the PNGs from disk
+    loaded = list(executor.map(_load_bgr, img_paths))
+    readable = []
+    for i, img in enumerate(loaded):
+        if isinstance(img, Exception):
+            sys.stderr.write(f"  page {infos[i]['page']}: read failed ({img})\n")
+            sys.stderr.flush()
+        else:
+            readable.append(i)
+
+    # Step 1: Detect orientation and auto-rotate
+    angles = [None] * len(img_paths)
+    if len(readable) > 1:
+        try:
+            ori_inputs = [loaded[i] for i in readable]
+            ori_results = list(ori_model.predict(input=ori_inputs, batch_size=len(ori_inputs)))
+            if len(ori_results) == len(readable):
+                for i, r in zip(readable, ori_results):
+                    angles[i] = int(r["label_names"][0])
+        except Exception:
+            pass  # retry page by page below
+
+    # One page at a time for whatever the batch didn't settle, so a single
+    # bad page doesn't cost its neighbours their orientation
+    for i in readable:
+        if angles[i] is not None:
+            continue
         try:
-            # Step 1: Detect orientation and auto-rotate
-            ori_result = next(ori_model.predict(input=img_path))
-            angle = int(ori_result["label_names"][0])
-            info["rotated"] = angle
+            r = next(iter(ori_model.predict(input=loaded[i], batch_size=1)))
+            angles[i] = int(r["label_names"][0])
+        except Exception as e:
+            sys.stderr.write(f"  page {infos[i]['page']}: orientation failed ({e})\n")
+            sys.stderr.flush()
 
-            img = Image.open(img_path)
+    for i, angle in enumerate(angles):
+        if angle is None:
+            continue
+        try:
+            infos[i]["rotated"] = angle
+            img = loaded[i]
             if angle != 0:
-                # PIL rotate is counter-clockwise; to correct a document
-                # detected as rotated N° CW, we rotate N° CCW
-                img = img.rotate(angle, expand=True)
-                sys.stderr.write(f"  page {page_idx}: rotated {angle}° to correct\n")
+                # To correct a document detected as rotated N° CW, we
+                # rotate N° CCW
+                img = cv2.rotate(img, ccw_rotations[angle])
+                sys.stderr.write(f"  page {infos[i]['page']}: rotated {angle}° to correct\n")
                 sys.stderr.flush()
+            imgs[i] = img
+        except Exception as e:
+            sys.stderr.write(f"  page {infos[i]['page']}: rotation failed ({e})\n")
+            sys.stderr.flush()
 
-            # Step 2: Unwarp curved/folded documents
-            try:
-                # UVDoc expects a file path — save rotated image to temp file
-                if angle != 0:
-                    import tempfile
-                    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-                        tmp_path = tmp.name
-                    img.save(tmp_path)
-                    unwarp_input = tmp_path
-                else:
-                    unwarp_input = img_path
-                    tmp_path = None
-
-                unwarp_result = next(unwarp_model.predict(input=unwarp_input))
-                doctr_img = unwarp_result["doctr_img"]  # numpy ndarray (H, W, 3) BGR
-
-                if isinstance(doctr_img, np.ndarray):
-                    # BGR -> RGB for PIL
-                    img = Image.fromarray(doctr_img[:, :, ::-1])
-                    info["unwarped"] = True
-                    sys.stderr.write(f"  page {page_idx}: unwarped\n")
-                    sys.stderr.flush()
-
-                if tmp_path:
-                    os.unlink(tmp_path)
+    # Step 2: Unwarp curved/folded documents, one batch per page shape
+    candidates = [i for i in range(len(img_paths)) if imgs[i] is not None]
+    if skip_unwarp_if_flat and candidates:
+        checks = list(executor.map(_check_flat, [imgs[i] for i in candidates]))
+        # The flat check only saves work — a page it can't judge is unwarped
+        for i, f in zip(candidates, checks):
+            if isinstance(f, Exception):
+                sys.stderr.write(f"  page {infos[i]['page']}: flat check failed ({f}), unwarping anyway\n")
+            elif f:
+                sys.stderr.write(f"  page {infos[i]['page']}: flat, unwarping skipped\n")
+        sys.stderr.flush()
+        candidates = [i for i, f in zip(candidates, checks) if f is not True]
+
+    groups: dict[tuple, list[int]] = {}
+    for i in candidates:
+        groups.setdefault(imgs[i].shape, []).append(i)
+
+    def apply_unwarp(i: int, unwarp_result) -> None:
+        doctr_img = unwarp_result["doctr_img"]  # numpy ndarray (H, W, 3) BGR
+
+        if isinstance(doctr_img, np.ndarray):
+            imgs[i] = doctr_img
+            infos[i]["unwarped"] = True
+            sys.stderr.write(f"  page {infos[i]['page']}: unwarped\n")
+            sys.stderr.flush()
 
+    for idxs in groups.values():
+        # PaddleX models take BGR ndarrays, so pages go straight in from
+        # memory without a temp-file round trip
+        if len(idxs) > 1:
+            try:
+                unwarp_inputs = [imgs[i] for i in idxs]
+                unwarp_results = list(unwarp_model.predict(input=unwarp_inputs, batch_size=len(unwarp_inputs)))
+                if len(unwarp_results) == len(idxs):
+                    for i, unwarp_result in zip(idxs, unwarp_results):
+                        apply_unwarp(i, unwarp_result)
+                    continue
+            except Exception:
+                pass  # retry page by page below
+
+        # One page at a time, so a single bad page doesn't cost its
+        # neighbours their unwarping
+        for i in idxs:
+            try:
+                apply_unwarp(i, next(iter(unwarp_model.predict(input=imgs[i], batch_size=1))))
             except Exception as e:
-                sys.stderr.write(f"  page {page_idx}: unwarping skipped ({e})\n")
+                sys.stderr.write(f"  page {infos[i]['page']}: unwarping skipped ({e})\n")
                 sys.stderr.flush()
 
+    enhance = os.environ.get("VLM_ENHANCE", "").lower() in ("1", "true", "yes")
+
+    def finish_page(i: int) -> str:
+        info = infos[i]
+        page_idx = info["page"]
+        out_file = f"page_{page_idx}_pre.jpg"
+        out_path = os.path.join(image_dir, out_file)
+        img = imgs[i]
+
+        try:
+            if img is None:
+                raise RuntimeError("orientation/rotation unavailable")
+
             # Step 3: Optional enhancement — CLAHE + denoise + sharpen
-            if os.environ.get("VLM_ENHANCE", "").lower() in ("1", "true", "yes"):
+            if enhance:
                 try:
                     img = enhance_image(img)
                     info["enhanced"] = True
@@ -170,42 +351,144 @@ def preprocess(image_dir: str) -> dict:
                     sys.stderr.flush()
 
             # Step 4: Convert to JPEG q90, cap at 5MB
-            out_file = f"page_{page_idx}_pre.jpg"
-            out_path = os.path.join(image_dir, out_file)
             save_capped_jpeg(img, out_path)
-            info["file"] = out_file
 
             size_kb = os.path.getsize(out_path) / 1024
             sys.stderr.write(f"  page {page_idx}: saved {out_file} ({size_kb:.0f}KB)\n")
             sys.stderr.flush()
 
         except Exception as e:
-            # Fallback: just convert original to JPEG
+            # Fallback: just convert original to JPEG (reusing the decode
+            # from the start of the batch when it succeeded)
             sys.stderr.write(f"  page {page_idx}: preprocessing failed ({e}), using fallback\n")
             sys.stderr.flush()
-            img = Image.open(img_path)
-            out_file = f"page_{page_idx}_pre.jpg"
-            out_path = os.path.join(image_dir, out_file)
-            save_capped_jpeg(img, out_path)
-            info["file"] = out_file
+            original = loaded[i]
+            if isinstance(original, Exception):
+                original = read_bgr(img_paths[i])
+            save_capped_jpeg(original, out_path)
+
+        return out_file
+
+    # Encoding releases the GIL inside OpenCV, so pages encode in parallel
+    futures = {executor.submit(finish_page, i): i for i in range(len(img_paths))}
+    for future in as_completed(futures):
+        infos[futures[future]]["file"] = future.result()
+
+    return infos
+
+
+def load_models() -> tuple:
+    """Load the orientation and UVDoc models (ori_model, unwarp_model)."""
+    from paddlex import create_model
+
+    sys.stderr.write("vlm_preprocess: loading orientation model...\n")
+    sys.stderr.flush()
+    ori_model = create_model("PP-LCNet_x1_0_doc_ori")
+
+    sys.stderr.write("vlm_preprocess: loading UVDoc model...\n")
+    sys.stderr.flush()
+    unwarp_model = create_model("UVDoc")
+
+    sys.stderr.write("vlm_preprocess: models loaded\n")
+    sys.stderr.flush()
+    return ori_model, unwarp_model
 
-        pages.append(info)
+
+def preprocess(image_dir: str, models: tuple | None = None, skip_unwarp_if_flat: bool = False) -> dict:
+    """Run orientation + unwarping + JPEG conversion on all page images.
+
+    Pages are processed in batches of PREPROCESS_BATCH_SIZE so the models
+    see a few pages per call while memory stays bounded on long PDFs.
+    Pass models from load_models() to reuse them across calls. With
+    skip_unwarp_if_flat, pages that pass is_flat_page() bypass UVDoc.
+    """
+    # Load models once
+    ori_model, unwarp_model = models or load_models()
+
+    # Find page images in order
+    images = find_page_images(image_dir)
+
+    if not images:
+        raise FileNotFoundError(f"No page_*.png images found in {image_dir}")
+
+    pages = []
+    with ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 1) // 2)) as executor:
+        for start in range(0, len(images), PREPROCESS_BATCH_SIZE):
+            batch = images[start:start + PREPROCESS_BATCH_SIZE]
+            pages.extend(preprocess_batch(
+                batch, start + 1, image_dir, ori_model, unwarp_model, executor, skip_unwarp_if_flat,
+            ))
 
     return {"pages": pages}
 
 
+def claim_stdout():
+    """Reserve the real stdout for protocol responses; send all other output to stderr.
+
+    Paddle and PaddleX print to stdout (some of it from native code), which
+    would otherwise land between NDJSON responses. Returns a text stream on
+    a duplicate of the original stdout; fd 1 and sys.stdout then point at
+    stderr.
+    """
+    sys.stdout.flush()
+    out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    return out
+
+
+def run_daemon() -> None:
+    """Load models once, then serve NDJSON requests from stdin until EOF."""
+    out = claim_stdout()
+    models = load_models()
+
+    # Signal ready
+    sys.stderr.write("vlm_preprocess daemon ready\n")
+    sys.stderr.flush()
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+            image_dir = request.get("imageDir", "")
+
+            if not image_dir or not os.path.isdir(image_dir):
+                result = {"error": f"Directory not found: {image_dir}"}
+            else:
+                skip_flat = bool(request.get("skipUnwarpIfFlat", False))
+                result = preprocess(image_dir, models=models, skip_unwarp_if_flat=skip_flat)
+
+        except Exception as e:
+            result = {"error": str(e)}
+
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print(json.dumps({"error": "Usage: python vlm_preprocess.py <image_dir>"}), file=sys.stderr)
+    if sys.argv[1:] == ["--daemon"]:
+        run_daemon()
+        sys.exit(0)
+
+    args = sys.argv[1:]
+    skip_flat = "--skip-unwarp-if-flat" in args
+    if skip_flat:
+        args.remove("--skip-unwarp-if-flat")
+
+    if len(args) != 1:
+        print(json.dumps({"error": "Usage: python vlm_preprocess.py [--skip-unwarp-if-flat] <image_dir> | --daemon"}), file=sys.stderr)
         sys.exit(1)
 
-    image_dir = sys.argv[1]
+    image_dir = args[0]
     if not os.path.isdir(image_dir):
         print(json.dumps({"error": f"Directory not found: {image_dir}"}), file=sys.stderr)
         sys.exit(1)
 
     try:
-        data = preprocess(image_dir)
+        data = preprocess(image_dir, skip_unwarp_if_flat=skip_flat)
         print(json.dumps(data, ensure_ascii=False))
     except Exception as e:
         import traceback